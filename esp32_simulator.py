@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+"""Software ESP32 running the servo_controls.cpp protocol on a virtual serial port (pty).
+
+Point SERIAL_PORT (or a lane's "serial_port") in grand_final_setup.py at the printed
+device path, then feed eggs from a recorded trigger trace or at a fixed rate:
+
+    python esp32_simulator.py --eggs 50 --rate 0.5
+    python esp32_simulator.py --trace trigger_trace.csv --speed 2 --link /tmp/ttyESP32
+
+A trace is a CSV with a "t" column (seconds since the first egg). servo_listener.py
+can record one from the real conveyor.
+"""
+
+import argparse
+import csv
+import os
+from collections import deque
+import pty
+import random
+import select
+import threading
+import time
+import tty
+
+# --- Firmware constants (keep in sync with servo_controls.cpp) ---
+PUSHER_PUSH_ANGLE = 0
+PUSHER_IDLE_ANGLE = 90
+
+SORTING_IDLE_ANGLE = 0
+SORTING_AA_ANGLE = 63
+SORTING_A_ANGLE = 43
+SORTING_B_ANGLE = 20
+SORTING_INEDIBLE_ANGLE = 0
+
+IR_POLL_SEC = 0.05        # irSensorTask vTaskDelay(50)
+SERIAL_POLL_SEC = 0.02    # serialMonitorTask vTaskDelay(20)
+PUSHER_DELAY_SEC = 1.0    # Delay between a grade command and the push
+RETRACT_DELAY_SEC = 0.2   # Delay between OBJECT_GONE and retracting the pusher
+
+# --- Physical model ---
+SERVO_SEC_PER_DEG = 0.1 / 60   # SG90-class servo, ~0.1s per 60 degrees
+GRADE_TIMEOUT_SEC = 10.0       # An egg with no grade after this long is cleared by hand ("stuck")
+EGG_TRANSIT_SEC = 0.3          # Min time for the conveyor to bring the next egg after one clears
+MIN_RESPONSE_SEC = 1.3         # Pi's EGG_SETTLE_DELAY_SEC: no grade can answer a trigger sooner than this
+MAX_RESPONSE_SEC = 5.0         # A trigger not answered within this long counts as dropped by the Pi
+
+BIN_BY_ANGLE = {
+    SORTING_AA_ANGLE: "AA",
+    SORTING_A_ANGLE: "A",
+    SORTING_B_ANGLE: "B",
+    SORTING_INEDIBLE_ANGLE: "INEDIBLE",
+}
+
+def parse_grade_command(command):
+    """Same matching as serialMonitorTask: returns (bin, angle) or None for an unknown command."""
+    command = command.strip().upper()
+    if command.startswith("GRADE_AA"):
+        return "AA", SORTING_AA_ANGLE
+    elif command.startswith("GRADE_A"):
+        return "A", SORTING_A_ANGLE
+    elif command.startswith("GRADE_B"):
+        return "B", SORTING_B_ANGLE
+    elif command.startswith("GRADE_INEDIBLE"):
+        return "INEDIBLE", SORTING_INEDIBLE_ANGLE
+    return None
+
+def load_trace(path):
+    """Raises ValueError if the CSV has no numeric 't' column."""
+    events = []
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        if "t" not in (reader.fieldnames or []):
+            raise ValueError("no 't' column")
+        for line, row in enumerate(reader, start=2):
+            try:
+                events.append(float(row["t"]))
+            except (TypeError, ValueError):
+                raise ValueError(f"line {line}: 't' is not a number: {row['t']!r}")
+    return sorted(events)
+
+def generate_trace(eggs, rate, jitter=0.0):
+    events = []
+    t = 0.0
+    for _ in range(eggs):
+        events.append(t)
+        gap = 1.0 / rate
+        t += max(0.0, random.uniform(gap * (1 - jitter), gap * (1 + jitter)))
+    return events
+
+class ESP32Simulator:
+    """Mirrors the three FreeRTOS tasks of servo_controls.cpp as threads on one pty."""
+
+    def __init__(self, pusher_delay=PUSHER_DELAY_SEC, servo_sec_per_deg=SERVO_SEC_PER_DEG,
+                 grade_timeout=GRADE_TIMEOUT_SEC, transit=EGG_TRANSIT_SEC,
+                 min_response=MIN_RESPONSE_SEC, max_response=MAX_RESPONSE_SEC, verbose=False):
+        self.pusher_delay = pusher_delay
+        self.servo_sec_per_deg = servo_sec_per_deg
+        self.grade_timeout = grade_timeout
+        self.transit = transit
+        self.min_response = min_response
+        self.max_response = max_response
+        self.verbose = verbose
+
+        self.master_fd, self.slave_fd = pty.openpty()
+        tty.setraw(self.slave_fd) # No echo / newline translation, like a real UART
+        os.set_blocking(self.master_fd, False)
+        self.port = os.ttyname(self.slave_fd)
+
+        self.running = threading.Event()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._notify = threading.Condition()
+        self._notify_value = None # xTaskNotify with eSetValueWithOverwrite: one slot, last value wins
+        self._threads = []
+
+        self.platform_egg = None
+        self.last_cleared_at = 0.0
+        self.sorting_angle = SORTING_IDLE_ANGLE
+        self.sorting_settled_at = 0.0
+        self.pusher_angle = PUSHER_IDLE_ANGLE
+
+        self.eggs = []
+        self.pending_triggers = deque() # Triggered eggs the Pi has not answered yet, oldest first
+        self.counters = {
+            "triggers_sent": 0,
+            "grade_commands": 0,
+            "extra_grades": 0,      # Grade for an egg that was already graded
+            "orphan_grades": 0,     # Grade with no egg on the platform
+            "late_grades": 0,       # Grade answering an egg that had already left the platform
+            "suspect_grades": 0,    # Grade matching no trigger between min_response and max_response old
+            "unknown_commands": 0,
+            "empty_pushes": 0,
+            "dropped_lines": 0,     # Output lost because nobody was reading the port
+        }
+
+    # --- Serial I/O ---
+    def send(self, line):
+        with self._write_lock:
+            try:
+                os.write(self.master_fd, (line + "\r\n").encode("utf-8"))
+            except BlockingIOError:
+                self.counters["dropped_lines"] += 1
+            except OSError: # Port already closed by stop()
+                return
+        if self.verbose:
+            print(f"  -> {line}")
+
+    def notify_pusher(self, value):
+        with self._notify:
+            self._notify_value = value
+            self._notify.notify()
+
+    def move_time(self, from_angle, to_angle):
+        return abs(to_angle - from_angle) * self.servo_sec_per_deg
+
+    # --- Firmware tasks ---
+    def ir_sensor_task(self):
+        last_state_low = False
+        while self.running.is_set():
+            with self._lock:
+                egg = self.platform_egg
+            current_state_low = egg is not None
+
+            if current_state_low != last_state_low:
+                if current_state_low: # Object just appeared
+                    with self._lock:
+                        egg["triggered_at"] = time.perf_counter()
+                        self.pending_triggers.append(egg)
+                    self.counters["triggers_sent"] += 1
+                    self.send("OBJECT_DETECTED")
+                else: # Object just disappeared
+                    self.send("OBJECT_GONE")
+                    self.notify_pusher(0)
+                last_state_low = current_state_low
+            time.sleep(IR_POLL_SEC)
+
+    def pusher_motor_task(self):
+        while self.running.is_set():
+            with self._notify:
+                if self._notify_value is None:
+                    self._notify.wait(timeout=0.1)
+                command, self._notify_value = self._notify_value, None
+            if command is None:
+                continue
+
+            if command == 1:
+                self.send("Pusher task received PUSH command. Waiting 1 second...")
+                time.sleep(self.pusher_delay)
+                self.send("Moving pusher servo to PUSH angle.")
+                time.sleep(self.move_time(self.pusher_angle, PUSHER_PUSH_ANGLE))
+                self.pusher_angle = PUSHER_PUSH_ANGLE
+                self.push_egg()
+
+            elif command == 0:
+                self.send("Pusher task received GONE command. Waiting 0.2 seconds before retracting.")
+                time.sleep(RETRACT_DELAY_SEC)
+                self.send("Moving pusher servo to IDLE angle.")
+                time.sleep(self.move_time(self.pusher_angle, PUSHER_IDLE_ANGLE))
+                self.pusher_angle = PUSHER_IDLE_ANGLE
+
+    def serial_monitor_task(self):
+        buffer = b""
+        while self.running.is_set():
+            ready, _, _ = select.select([self.master_fd], [], [], SERIAL_POLL_SEC)
+            if not ready:
+                continue
+            try:
+                buffer += os.read(self.master_fd, 1024)
+            except (BlockingIOError, OSError):
+                continue
+
+            while b"\n" in buffer:
+                raw, buffer = buffer.split(b"\n", 1)
+                command = raw.decode("utf-8", errors="replace").strip()
+                if self.verbose:
+                    print(f"  <- {command}")
+                self.send(f"Received command from Pi: {command}")
+                self.handle_command(command)
+
+    # --- Physical model ---
+    def handle_command(self, command):
+        parsed = parse_grade_command(command)
+        if parsed is None:
+            self.counters["unknown_commands"] += 1
+            self.send(f"Unknown command: {command.upper()}")
+            return
+
+        bin_name, angle = parsed
+        now = time.perf_counter()
+        self.counters["grade_commands"] += 1
+        late_source = None
+        with self._lock:
+            self.sorting_settled_at = now + self.move_time(self.sorting_angle, angle)
+            self.sorting_angle = angle
+
+            egg = self.platform_egg
+            source = self.match_trigger(now)
+            if source is None:
+                # No trigger this grade can be answering (too old or too recent): never counts as sorted
+                self.counters["suspect_grades"] += 1
+                if egg is not None and egg["grade"] is None:
+                    egg["grade"] = bin_name
+                    egg["graded_at"] = now
+            elif source is not egg:
+                # The Pi is answering an egg that already left; the grade lands on whatever is on the platform
+                self.counters["late_grades"] += 1
+                late_source = source
+                if egg is not None and egg["grade"] is None:
+                    egg["grade"] = bin_name
+                    egg["graded_at"] = now
+                    egg["grade_from"] = source["id"]
+            elif egg is None:
+                self.counters["orphan_grades"] += 1
+            elif egg["grade"] is not None:
+                self.counters["extra_grades"] += 1
+            else:
+                egg["grade"] = bin_name
+                egg["graded_at"] = now
+                egg["grade_from"] = egg["id"]
+
+        if late_source is not None:
+            print(f"❌ [EGG {late_source['id']}] Late grade {bin_name}: egg already left the platform.")
+        elif source is None:
+            print(f"❌ Suspect grade {bin_name}: no trigger between {self.min_response}s and {self.max_response}s old.")
+
+        self.send("Sorting servo moved. Notifying pusher task to begin push sequence.")
+        self.notify_pusher(1)
+
+    def match_trigger(self, now):
+        """The Pi answers triggers in order: match a grade to the oldest unanswered trigger.
+
+        Triggers older than max_response were dropped by the Pi and are discarded. Returns
+        None if the oldest remaining trigger is younger than min_response (or there is none).
+        Call with self._lock held.
+        """
+        while self.pending_triggers and self.pending_triggers[0]["triggered_at"] < now - self.max_response:
+            self.pending_triggers.popleft()
+        if self.pending_triggers and self.pending_triggers[0]["triggered_at"] <= now - self.min_response:
+            source = self.pending_triggers.popleft()
+            source["answered_at"] = now
+            return source
+        return None
+
+    def push_egg(self):
+        now = time.perf_counter()
+        with self._lock:
+            egg = self.platform_egg
+            if egg is None:
+                self.counters["empty_pushes"] += 1
+                return
+            # An egg pushed while the sorting servo is still travelling lands in an unknown bin
+            egg["bin"] = BIN_BY_ANGLE.get(self.sorting_angle, "UNKNOWN") if now >= self.sorting_settled_at else "IN_MOTION"
+            egg["cleared_at"] = now
+            self.last_cleared_at = now
+            self.platform_egg = None
+
+        if egg["grade"] is None:
+            status = "unsolicited push"
+        elif egg["grade_from"] is None:
+            status = "MIS-SORTED (suspect grade)"
+        elif egg["grade_from"] != egg["id"]:
+            status = f"MIS-SORTED (late grade from egg {egg['grade_from']})"
+        elif egg["bin"] == egg["grade"]:
+            status = "sorted"
+        else:
+            status = "MIS-SORTED"
+        print(f"[EGG {egg['id']}] {status}: grade={egg['grade']} bin={egg['bin']}")
+
+    def platform_free(self):
+        """True once the platform is empty and the conveyor had time to bring the next egg."""
+        return self.clear_stuck_egg() and time.perf_counter() >= self.last_cleared_at + self.transit
+
+    def clear_stuck_egg(self):
+        """Operator removes an egg that never got a grade. Returns True if the platform is empty."""
+        with self._lock:
+            egg = self.platform_egg
+            if egg is None:
+                return True
+            if egg["grade"] is not None or time.perf_counter() - egg["arrived_at"] < self.grade_timeout:
+                return False
+            egg["bin"] = "STUCK"
+            egg["cleared_at"] = self.last_cleared_at = time.perf_counter()
+            self.platform_egg = None
+        print(f"❌ [EGG {egg['id']}] No grade after {self.grade_timeout}s (triggered={egg['triggered_at'] is not None}). Cleared by hand.")
+        return True
+
+    def place_egg(self):
+        egg = {
+            "id": len(self.eggs) + 1,
+            "arrived_at": time.perf_counter(),
+            "triggered_at": None,
+            "grade": None,
+            "graded_at": None,
+            "grade_from": None,   # id of the egg whose trigger this grade answered
+            "answered_at": None,  # When the Pi answered this egg's trigger (wherever the grade landed)
+            "bin": None,
+            "cleared_at": None,
+        }
+        with self._lock:
+            self.eggs.append(egg)
+            self.platform_egg = egg
+        return egg
+
+    # --- Run ---
+    def start(self):
+        self.running.set()
+        for task in (self.ir_sensor_task, self.pusher_motor_task, self.serial_monitor_task):
+            thread = threading.Thread(target=task, name=task.__name__, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self.running.clear()
+        for thread in self._threads: # The pusher may be mid-sequence (pusher_delay + servo travel)
+            thread.join(timeout=self.pusher_delay + RETRACT_DELAY_SEC + 1.0)
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
+
+    def replay(self, events, speed=1.0):
+        """Feed eggs at the trace times divided by `speed`. Eggs queue while the platform is busy."""
+        start = time.perf_counter()
+        for scheduled in events:
+            due = start + scheduled / speed
+            while time.perf_counter() < due:
+                time.sleep(min(0.01, max(0.0, due - time.perf_counter())))
+            while not self.platform_free():
+                time.sleep(0.01)
+            egg = self.place_egg()
+            egg["scheduled_at"] = due
+
+        while not self.clear_stuck_egg():
+            time.sleep(0.01)
+        time.sleep(IR_POLL_SEC * 2 + RETRACT_DELAY_SEC) # Let the last OBJECT_GONE / retract finish
+        return time.perf_counter() - start
+
+def print_report(sim, events, speed, elapsed):
+    eggs = sim.eggs
+    graded = [egg for egg in eggs if egg["grade"] is not None and egg["bin"] is not None]
+    sorted_ok = [egg for egg in graded if egg["bin"] == egg["grade"] and egg["grade_from"] == egg["id"]]
+    mis_sorted = [egg for egg in graded if egg not in sorted_ok]
+    missed_triggers = [egg for egg in eggs if egg["triggered_at"] is None]
+    unanswered = [egg for egg in eggs if egg["triggered_at"] is not None and egg["answered_at"] is None]
+    stuck = [egg for egg in eggs if egg["bin"] == "STUCK"]
+    latencies = [egg["answered_at"] - egg["triggered_at"] for egg in eggs if egg["answered_at"] is not None]
+    backlog = [egg["arrived_at"] - egg["scheduled_at"] for egg in eggs]
+
+    span = (events[-1] - events[0]) / speed if len(events) > 1 else 0.0
+    offered_rate = (len(events) - 1) / span if span > 0 else 0.0
+
+    print("\n--- ESP32 Simulator Report ---")
+    print(f"Eggs fed:            {len(eggs)} (offered {offered_rate:.2f} eggs/s, speed x{speed})")
+    print(f"Sorted correctly:    {len(sorted_ok)}")
+    print(f"Mis-sorted:          {len(mis_sorted)}")
+    print(f"Stuck (no grade):    {len(stuck)}")
+    print(f"Missed IR triggers:  {len(missed_triggers)}")
+    print(f"Unanswered triggers: {len(unanswered)}" + (f" (eggs {', '.join(str(egg['id']) for egg in unanswered)})" if unanswered else ""))
+    for name, value in sim.counters.items():
+        print(f"{name + ':':<21}{value}")
+    if latencies:
+        print(f"Trigger->grade:      min {min(latencies):.3f}s / avg {sum(latencies) / len(latencies):.3f}s / max {max(latencies):.3f}s")
+    if backlog:
+        print(f"Max conveyor backlog:{max(backlog):.3f}s")
+    print(f"Sustained rate:      {len(sorted_ok) / elapsed:.2f} eggs/s over {elapsed:.1f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Virtual ESP32 sorter for testing grand_final_setup.py without hardware.")
+    parser.add_argument("--trace", help="CSV trigger trace with a 't' column")
+    parser.add_argument("--eggs", type=int, default=20, help="Eggs to generate when no trace is given")
+    parser.add_argument("--rate", type=float, default=0.2, help="Eggs per second when no trace is given")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random spread of generated gaps (0.2 = +/-20%%)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay the trace this many times faster")
+    parser.add_argument("--pusher-delay", type=float, default=PUSHER_DELAY_SEC, help="Seconds between grade and push")
+    parser.add_argument("--servo-sec-per-deg", type=float, default=SERVO_SEC_PER_DEG, help="Servo travel time per degree")
+    parser.add_argument("--transit", type=float, default=EGG_TRANSIT_SEC, help="Min seconds between one egg clearing and the next arriving")
+    parser.add_argument("--grade-timeout", type=float, default=GRADE_TIMEOUT_SEC, help="Seconds before an ungraded egg counts as stuck")
+    parser.add_argument("--min-response", type=float, default=MIN_RESPONSE_SEC, help="Fastest the Pi can answer a trigger (its settle delay)")
+    parser.add_argument("--max-response", type=float, default=MAX_RESPONSE_SEC, help="Slowest answer still matched to a trigger; later grades are suspect")
+    parser.add_argument("--startup-wait", type=float, default=0.0, help="Seconds to wait after opening the port before feeding eggs")
+    parser.add_argument("--link", help="Also expose the port under this path (symlink), e.g. /tmp/ttyESP32")
+    parser.add_argument("--verbose", action="store_true", help="Print all serial traffic")
+    args = parser.parse_args()
+    if args.rate <= 0:
+        parser.error("--rate must be greater than 0")
+    if args.speed <= 0:
+        parser.error("--speed must be greater than 0")
+    if args.max_response < args.min_response:
+        parser.error("--max-response must not be less than --min-response")
+
+    if args.trace:
+        try:
+            events = load_trace(args.trace)
+        except (OSError, ValueError) as e:
+            parser.error(f"bad trace {args.trace}: {e}")
+    else:
+        events = generate_trace(args.eggs, args.rate, args.jitter)
+    if not events:
+        print("[ERROR] Trace is empty.")
+        return
+
+    sim = ESP32Simulator(args.pusher_delay, args.servo_sec_per_deg, args.grade_timeout, args.transit,
+                         args.min_response, args.max_response, args.verbose)
+    if args.link:
+        if os.path.islink(args.link):
+            os.remove(args.link)
+        os.symlink(sim.port, args.link)
+
+    print("--- ESP32 Simulator ---")
+    print(f"✅ Virtual serial port: {sim.port}" + (f" (linked at {args.link})" if args.link else ""))
+    print(f"Feeding {len(events)} eggs...")
+
+    try:
+        sim.start()
+        sim.send("Setup complete. Both servos at idle.")
+        time.sleep(args.startup_wait)
+        elapsed = sim.replay(events, args.speed)
+        print_report(sim, events, args.speed, elapsed)
+    except KeyboardInterrupt:
+        print("\nSimulation stopped by user.")
+    finally:
+        sim.stop()
+        if args.link and os.path.islink(args.link):
+            os.remove(args.link)
+        print("Virtual serial port closed.")
+
+if __name__ == '__main__':
+    main()
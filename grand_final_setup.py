@@ -4,12 +4,12 @@ import cv2
 import numpy as np
 import serial  # For serial communication
 import time
-from picamera2 import Picamera2
-from ultralytics import YOLO
 from datetime import datetime
 import os
 import json
+import queue
 import threading
+from concurrent.futures import Future
 import uvicorn
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
@@ -24,20 +24,62 @@ LOG_PATH = os.path.join(SAVE_DIR, "egg_results.json")
 
 SIZE_SMALL_MAX = 300  # Max diagonal pixels for "Small/Peewee"
 SIZE_MEDIUM_MAX = 375 # Max diagonal pixels for "Medium"
+DETECTION_CONF = 0.3  # Min model confidence for a detection to count
 
 EGG_SETTLE_DELAY_SEC = 1.3   # (1.3s) Time to wait for the egg to stop bouncing
 CAPTURE_COOLDOWN_SEC = 2.0   # (2.0s) Time to ignore new triggers after a capture
 
-print(f"Loading model from: {MODEL_PATH}")
-model = YOLO(MODEL_PATH)
-print("✅ Model loaded.")
-
-picam2 = Picamera2()
-camera_config = picam2.create_preview_configuration(main={"size": (640, 480), "format": "RGB888"})
-picam2.configure(camera_config)
-picam2.start()
-print("✅ Camera started.")
-time.sleep(2.0) # Allow camera to warm up
+CAMERA_WARMUP_SEC = 2.0     # (2.0s) Time to let the camera auto-exposure settle
+READY_WAIT_SEC = 10.0       # (10s) Max time a trigger waits for the model/camera to finish loading
+CAMERA_MAX_FAILURES = 20    # Consecutive failed captures before a lane restarts its camera (also the log interval)
+CAMERA_RETRY_SEC = 5.0      # (5s) Time between attempts to restart a broken camera
+
+BATCH_WINDOW_SEC = 0.05     # (50ms) Time the inference server waits to merge requests from other lanes
+BATCH_MAX_SIZE = 8          # Max frames per batched inference call
+PREDICT_TIMEOUT_SEC = 30.0  # (30s) Max time a lane waits for its inference result
+
+# One entry per conveyor lane. Every lane has its own camera, ESP32 and thresholds,
+# but all lanes share one loaded model through the inference server.
+#   camera: Picamera2 camera number (int), or a cv2.VideoCapture source (device path / video file)
+#   roi:    (x1, y1, x2, y2) part of the frame to grade, or None for the whole frame
+LANES = [
+    {
+        "name": "lane1",
+        "camera": 0,
+        "serial_port": SERIAL_PORT,
+        "roi": None,
+        "size_small_max": SIZE_SMALL_MAX,
+        "size_medium_max": SIZE_MEDIUM_MAX,
+        "conf": DETECTION_CONF,
+    },
+]
+DEFAULT_LANE = LANES[0]["name"] # Results logged before lanes existed belong to this lane
+
+STARTUP_T0 = time.perf_counter()
+startup_timings = {}  # stage name -> seconds, filled in as each stage finishes
+startup_errors = {}   # component name -> error message, for startup failures only
+_ready_lock = threading.Lock()
+_errors_lock = threading.Lock() # Guards startup_errors and Lane.errors; the API thread reads them
+_log_lock = threading.Lock()
+stop_event = threading.Event()
+
+def record_stage(stage, started):
+    elapsed = round(time.perf_counter() - started, 3)
+    startup_timings[stage] = elapsed
+    print(f"⏱️  [STARTUP] {stage}: {elapsed:.3f}s")
+
+def record_startup_error(component, error):
+    with _errors_lock:
+        startup_errors[component] = str(error)
+
+def get_startup_errors():
+    with _errors_lock:
+        return dict(startup_errors)
+
+def _check_ready():
+    with _ready_lock:
+        if is_ready() and "ready" not in startup_timings:
+            record_stage("ready", STARTUP_T0)
 
 os.makedirs(SAVE_DIR, exist_ok=True)
 if not os.path.exists(LOG_PATH):
@@ -45,21 +87,30 @@ if not os.path.exists(LOG_PATH):
         json.dump([], f)
 
 def save_result_to_json(result_data):
-    try:
-        with open(LOG_PATH, "r") as f: data = json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError): data = []
-    data.append(result_data)
-    with open(LOG_PATH, "w") as f:
-        json.dump(data, f, indent=4)
-
-def get_egg_size(cropped_image):
+    with _log_lock: # Lanes save from their own threads
+        try:
+            with open(LOG_PATH, "r") as f: data = json.load(f)
+        except (json.JSONDecodeError, FileNotFoundError): data = []
+        data.append(result_data)
+        with open(LOG_PATH, "w") as f:
+            json.dump(data, f, indent=4)
+
+def load_results_from_json():
+    with _log_lock:
+        try:
+            with open(LOG_PATH, "r") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, FileNotFoundError):
+            return []
+
+def get_egg_size(cropped_image, size_small_max=SIZE_SMALL_MAX, size_medium_max=SIZE_MEDIUM_MAX):
     try:
         h, w, _ = cropped_image.shape
         diagonal = np.sqrt(w**2 + h**2)
 
-        if diagonal <= SIZE_SMALL_MAX:
+        if diagonal <= size_small_max:
             size_label = "Smal" # Note: Kept as "Smal" from original code
-        elif diagonal <= SIZE_MEDIUM_MAX:
+        elif diagonal <= size_medium_max:
             size_label = "Medium"
         else:
             size_label = "Large"
@@ -69,12 +120,10 @@ def get_egg_size(cropped_image):
         print(f"[ERROR] Could not calculate size: {e}")
         return "Unknown", 0.0
 
-def get_stats_from_json():
-    try:
-        with open(LOG_PATH, "r") as f:
-            data = json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError):
-        data = []
+def get_stats_from_json(lane=None):
+    data = load_results_from_json()
+    if isinstance(data, list) and lane is not None:
+        data = [entry for entry in data if entry.get("lane", DEFAULT_LANE) == lane]
 
     if not data:
         return {
@@ -109,224 +158,532 @@ def get_stats_from_json():
         "label_counts_today": label_counts_today
     }
 
-def main():
-    ser = None
-    try:
-        print(f"Attempting to connect to {SERIAL_PORT}...")
-        ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=0.1)
-        print("✅ Serial connection successful! Starting monitoring UI...")
-
-        captured_img_thumb = np.zeros((120, 160, 3), dtype=np.uint8) # Default black thumbnail
+class InferenceServer:
+    """Owns the single loaded model and batches requests that arrive within BATCH_WINDOW_SEC."""
+
+    def __init__(self, model_path, window_sec=BATCH_WINDOW_SEC, max_batch=BATCH_MAX_SIZE):
+        self.model_path = model_path
+        self.window_sec = window_sec
+        self.max_batch = max_batch
+        self.model = None
+        self.names = {}
+        self.ready = threading.Event()
+        self._requests = queue.Queue()
+        
+    def load(self):
+        try:
+            started = time.perf_counter()
+            from ultralytics import YOLO
+            print(f"Loading model from: {self.model_path}")
+            loaded_model = YOLO(self.model_path)
+            record_stage("model_load", started)
+
+            started = time.perf_counter()
+            loaded_model(np.zeros((480, 640, 3), dtype=np.uint8), verbose=False, conf=DETECTION_CONF) # Warm-up inference
+            record_stage("model_warmup", started)
         
-        last_result = {
+            self.model = loaded_model
+            self.names = loaded_model.names
+            threading.Thread(target=self._run, name="inference-server", daemon=True).start()
+            self.ready.set()
+            print("✅ Model loaded.")
+            _check_ready()
+        except Exception as e:
+            record_startup_error("model", e)
+            print(f"❌ [MODEL ERROR] Could not load model: {e}")
+
+    def predict(self, frame, conf=DETECTION_CONF, timeout=PREDICT_TIMEOUT_SEC):
+        """Blocks until the batch containing `frame` has run, then returns its ultralytics Results."""
+        future = Future()
+        self._requests.put((frame, conf, future))
+        return future.result(timeout=timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._requests.get()]
+            deadline = time.perf_counter() + self.window_sec
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            frames = [frame for frame, _, _ in batch]
+            # Run at the lowest threshold in the batch; each lane filters by its own conf.
+            conf = min(c for _, c, _ in batch)
+            try:
+                results = self.model(frames, verbose=False, conf=conf)
+            except Exception as e:
+                print(f"❌ [MODEL ERROR] Batched inference failed: {e}")
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            if len(batch) > 1:
+                print(f"[INFO] Inference server ran a batch of {len(batch)} frames.")
+            for (_, _, future), result in zip(batch, results):
+                future.set_result(result)
+
+inference_server = InferenceServer(MODEL_PATH, window_sec=BATCH_WINDOW_SEC if len(LANES) > 1 else 0.0) # No one to wait for with a single lane
+
+class VideoCaptureCamera:
+    """cv2.VideoCapture with the capture_array()/stop() interface used for Picamera2."""
+
+    def __init__(self, source):
+        self.capture = cv2.VideoCapture(source)
+        if not self.capture.isOpened():
+            raise RuntimeError(f"Could not open video source {source!r}")
+
+    def capture_array(self):
+        ok, frame = self.capture.read()
+        if not ok: # Loop video files
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.capture.read()
+        if not ok:
+            raise RuntimeError("Could not read frame from video source")
+        return frame # Already BGR, same channel order as Picamera2's "RGB888"
+
+    def stop(self):
+        self.capture.release()
+
+class Lane:
+    """One conveyor lane: a camera, the ESP32 on its serial port, an ROI and grading thresholds."""
+
+    def __init__(self, name, camera=0, serial_port=SERIAL_PORT, roi=None,
+                 size_small_max=SIZE_SMALL_MAX, size_medium_max=SIZE_MEDIUM_MAX, conf=DETECTION_CONF):
+        self.name = name
+        self.camera_source = camera
+        self.serial_port = serial_port
+        self.roi = roi
+        self.size_small_max = size_small_max
+        self.size_medium_max = size_medium_max
+        self.conf = conf
+
+        self.camera = None
+        self.ser = None
+        self.camera_ready = threading.Event()
+        self.serial_ready = threading.Event()
+        self.errors = {} # Runtime errors by kind ("camera", "inference", ...), cleared on the next success
+        self.camera_failures = 0 # Consecutive failed captures
+        self.camera_retry_at = None # When to try restarting a camera that failed to restart
+
+        self.last_capture_time = 0.0 # Variable to track cooldown
+        self.last_result = {
             "label": "N/A", 
             "confidence": 0.0, 
             "size": "N/A",
             "date": "N/A",
             "time": "N/A"
         }
+        self.captured_img_thumb = np.zeros((120, 160, 3), dtype=np.uint8) # Default black thumbnail
+        self.display_frame = np.zeros((480, 640, 3), dtype=np.uint8) # Camera still warming up
+        self.stats = get_stats_from_json(lane=name)
         
-        last_capture_time = 0.0 # Variable to track cooldown
+    def start_camera(self, restart=False):
+        try:
+            started = time.perf_counter()
+            if isinstance(self.camera_source, int):
+                from picamera2 import Picamera2
+                camera = Picamera2(self.camera_source)
+                camera_config = camera.create_preview_configuration(main={"size": (640, 480), "format": "RGB888"})
+                camera.configure(camera_config)
+                camera.start()
+            else:
+                camera = VideoCaptureCamera(self.camera_source)
+            if not restart:
+                record_stage(f"camera_start[{self.name}]", started)
+
+            started = time.perf_counter()
+            time.sleep(CAMERA_WARMUP_SEC) # Allow camera to warm up
+            if not restart:
+                record_stage(f"camera_warmup[{self.name}]", started)
+
+            self.camera = camera
+            self.camera_ready.set()
+            print(f"✅ [{self.name}] Camera started.")
+            _check_ready()
+        except Exception as e:
+            if restart:
+                self.set_error("camera", e)
+                self.camera_retry_at = time.time() + CAMERA_RETRY_SEC
+            else:
+                record_startup_error(f"camera[{self.name}]", e)
+            print(f"❌ [{self.name}] [CAMERA ERROR] Could not start camera: {e}")
+
+    def restart_camera(self):
+        print(f"[{self.name}] Restarting camera...")
+        self.camera_ready.clear()
+        if self.camera is not None:
+            try:
+                self.camera.stop()
+            except Exception:
+                pass
+            self.camera = None
+        self.camera_failures = 0
+        self.start_camera(restart=True)
+
+    def set_error(self, kind, error):
+        with _errors_lock:
+            self.errors[kind] = {
+                "error": f"{type(error).__name__}: {error}",
+                "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            }
+
+    def clear_error(self, kind):
+        if kind in self.errors:
+            with _errors_lock:
+                self.errors.pop(kind, None)
+
+    def get_errors(self):
+        with _errors_lock:
+            return dict(self.errors)
+
+    def startup_failed(self):
+        errors = get_startup_errors()
+        return "model" in errors or f"camera[{self.name}]" in errors
+
+    def capture_frame(self):
+        """Capture a frame, tracking consecutive failures; restarts the camera if it stays broken."""
+        try:
+            frame = self.camera.capture_array()
+        except Exception as e:
+            self.camera_failures += 1
+            self.set_error("camera", e)
+            if self.camera_failures == 1 or self.camera_failures % CAMERA_MAX_FAILURES == 0:
+                print(f"❌ [{self.name}] [CAMERA ERROR] Capture failed ({self.camera_failures}x): {e}")
+            if self.camera_failures >= CAMERA_MAX_FAILURES:
+                self.restart_camera()
+            else:
+                time.sleep(0.5)
+            return None
+        self.camera_failures = 0
+        self.clear_error("camera")
+        return frame
+
+    def open_serial(self):
+        """Returns False (and marks only this lane as failed) if the ESP32 port cannot be opened."""
+        started = time.perf_counter()
+        print(f"[{self.name}] Attempting to connect to {self.serial_port}...")
+        try:
+            self.ser = serial.Serial(self.serial_port, BAUD_RATE, timeout=0.1)
+        except serial.SerialException as e:
+            record_startup_error(f"serial[{self.name}]", e)
+            print(f"❌ [{self.name}] SERIAL ERROR: Could not open port {self.serial_port}. Details: {e}")
+            return False
+        self.serial_ready.set()
+        record_stage(f"serial_open[{self.name}]", started)
+        print(f"✅ [{self.name}] Serial connection successful!")
+        return True
+
+    def is_ready(self):
+        return inference_server.ready.is_set() and self.camera_ready.is_set()
+
+    def crop_roi(self, frame):
+        if self.roi is None:
+            return frame, (0, 0)
+        x1, y1, x2, y2 = self.roi
+        return frame[y1:y2, x1:x2], (x1, y1)
+
+    def run(self):
+        """Lane worker: keeps the live frame fresh and grades an egg on every IR trigger."""
+        if not self.open_serial():
+            return
+
+        try:
+            while not stop_event.is_set():
+                if self.camera_ready.is_set():
+                    frame = self.capture_frame()
+                    if frame is not None:
+                        self.display_frame = frame
+                elif self.camera_retry_at is not None and time.time() >= self.camera_retry_at:
+                    self.camera_retry_at = None
+                    self.restart_camera()
+
+                if self.ser.in_waiting > 0:
+                    message = self.ser.readline().decode('utf-8').strip()
+
+                    if message == "OBJECT_DETECTED":
+                        try:
+                            self.handle_trigger()
+                            self.clear_error("trigger")
+                        except serial.SerialException:
+                            raise
+                        except Exception as e: # Log it and keep the lane alive
+                            self.set_error("trigger", e)
+                            print(f"❌ [{self.name}] [LANE ERROR] {type(e).__name__}: {e}")
+
+                time.sleep(0.01)
+        except serial.SerialException as e:
+            self.set_error("serial", e)
+            self.serial_ready.clear()
+            print(f"❌ [{self.name}] [SERIAL ERROR] Lane stopped. Details: {e}")
+
+    def handle_trigger(self):
+        current_time = time.time()
+
+        if (current_time - self.last_capture_time) <= CAPTURE_COOLDOWN_SEC:
+            print(f"\n[{self.name}] [INFO] Ignoring duplicate trigger (egg bounce).")
+            return
+
+        if self.startup_failed():
+            print(f"\n[{self.name}] [WARN] Model/camera failed to start. Ignoring trigger.")
+            return
+
+        if not self.is_ready():
+            print(f"\n[{self.name}] [INFO] Trigger received while model/camera are still loading. Waiting up to {READY_WAIT_SEC}s...")
+            inference_server.ready.wait(READY_WAIT_SEC)
+            self.camera_ready.wait(max(0.0, READY_WAIT_SEC - (time.time() - current_time)))
+            if not self.is_ready():
+                print(f"[{self.name}] [WARN] Model/camera not ready. Ignoring trigger.")
+                return
+
+        self.last_capture_time = current_time
+
+        print(f"\n✨ [{self.name}] Trigger received! Waiting {EGG_SETTLE_DELAY_SEC}s for egg to settle...")
+        time.sleep(EGG_SETTLE_DELAY_SEC)
+
+        self.ser.reset_input_buffer()
+
+        print(f"[{self.name}] Capturing and analyzing settled frame...")
+        analysis_frame = self.capture_frame()
+        if analysis_frame is None:
+            print(f"[{self.name}] [WARN] Could not capture settled frame. Ignoring trigger.")
+            return
+        display_frame_rgb = analysis_frame.copy()
+        roi_frame, (offset_x, offset_y) = self.crop_roi(analysis_frame)
+
+        try:
+            result = inference_server.predict(roi_frame, self.conf)
+        except Exception as e: # Failed batch or timeout; the next successful inference clears it
+            self.set_error("inference", e)
+            print(f"❌ [{self.name}] [MODEL ERROR] Inference failed: {type(e).__name__}: {e}")
+            return
+        self.clear_error("inference")
+        boxes = [box for box in result.boxes if float(box.conf[0]) >= self.conf]
+
+        if not boxes:
+            print(f"[{self.name}] [WARN] Trigger received, but no egg detected in settled frame.")
+            return
+
+        box = boxes[0]
+        label = inference_server.names[int(box.cls[0])] # This is the grade (e.g., "AA", "A", "B", "Inedible")
+        print(f"!!!!!!!!!! DEBUG: [{self.name}] Model label is: '{label}' !!!!!!!!!!")
+        conf = float(box.conf[0])
+        x1, y1, x2, y2 = map(int, box.xyxy[0])
+
+        text = f"{label} {conf:.2f}"
+        cv2.rectangle(display_frame_rgb, (x1 + offset_x, y1 + offset_y), (x2 + offset_x, y2 + offset_y), (255, 0, 0), 2)
+        cv2.putText(display_frame_rgb, text, (x1 + offset_x, y1 + offset_y - 5), cv2.FONT_HERSHEY_DUPLEX, 0.7, (255, 0, 0), 2)
+        self.display_frame = display_frame_rgb
+
+        cropped_egg_rgb = roi_frame[y1:y2, x1:x2]
+
+        if cropped_egg_rgb.size == 0:
+            print(f"[{self.name}] [WARN] Detection resulted in an invalid crop.")
+            return
+
+        print(f"[{self.name}] [INFO] Egg detected: {label} ({conf:.2f})")
+
+        size_label, diagonal_pixels = get_egg_size(cropped_egg_rgb, self.size_small_max, self.size_medium_max)
+        print(f"[{self.name}] [INFO] Size detected: {size_label} (Diagonal: {diagonal_pixels}px)")
+
+        serial_command_to_esp32 = f"GRADE_{label}\n"
+        try:
+            self.ser.write(serial_command_to_esp32.encode('utf-8'))
+            print(f"✅ [{self.name}] [SERIAL] Sent grade to ESP32: {serial_command_to_esp32.strip()}")
+        except serial.SerialException as e:
+            print(f"❌ [{self.name}] [SERIAL ERROR] Failed to send command: {e}")
+
+        now = datetime.now()
+        timestamp_str = now.strftime("%Y%m%d_%H%M%S")
+
+        filename = f"{timestamp_str}_{self.name}_{label}_{size_label}.jpg"
+        filepath = os.path.join(SAVE_DIR, filename)
+
+        cv2.imwrite(filepath, cropped_egg_rgb)
+        print(f"✅ [{self.name}] Cropped egg image saved to {filepath}")
+
+        result_entry = {
+            "timestamp": now.strftime("%Y-%m-%d %H:%M:%S"),
+            "lane": self.name,
+            "label": label,
+            "confidence": round(conf, 2),
+            "size": size_label,
+            "diagonal_pixels": diagonal_pixels,
+            "image_path": filepath
+        }
+        save_result_to_json(result_entry)
 
-        window_name = "Candled Egg Quality Detection"
-        cv2.namedWindow(window_name, cv2.WND_PROP_FULLSCREEN)
-        cv2.setWindowProperty(window_name, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
+        self.stats = get_stats_from_json(lane=self.name)
 
-        print("Loading initial statistics...")
-        stats = get_stats_from_json()
-        print(f"✅ Initial stats: {stats}")
-      
-        LABEL_MAP = {
-            "AA - Premium": "AA Premium",
-            "A - Good": "A Good",
-            "B - Fair": "B Fair", # Updated from "B Fail"
-            "Inedible": "Inedible"
+        self.last_result = {
+            "label": label,
+            "confidence": conf,
+            "size": size_label,
+            "date": now.strftime("%m-%d-%Y"),
+            "time": now.strftime("%I:%M:%S %p")
         }
-
-        while True:
-            frame_rgb = picam2.capture_array()
-            display_frame_rgb = frame_rgb.copy()
-
-            if ser.in_waiting > 0:
-                message = ser.readline().decode('utf-8').strip()
-
-                if message == "OBJECT_DETECTED":
-                    current_time = time.time()
-                    
-                    if (current_time - last_capture_time) > CAPTURE_COOLDOWN_SEC:
-                        
-                        last_capture_time = current_time 
-                        
-                        print(f"\n✨ Trigger received! Waiting {EGG_SETTLE_DELAY_SEC}s for egg to settle...")
-                        time.sleep(EGG_SETTLE_DELAY_SEC)
-                        
-                        ser.reset_input_buffer() 
-                        
-                        print("Capturing and analyzing settled frame...")
-                        analysis_frame = picam2.capture_array() 
-                        display_frame_rgb = analysis_frame.copy() 
-
-                        results = model(analysis_frame, verbose=False, conf=0.3)
-                        
-                        if len(results[0].boxes) > 0:
-                            box = results[0].boxes[0]
-                            label = model.names[int(box.cls[0])] # This is the grade (e.g., "AA", "A", "B", "Inedible")
-                            print(f"!!!!!!!!!! DEBUG: Model label is: '{label}' !!!!!!!!!!")
-                            conf = float(box.conf[0])
-                            x1, y1, x2, y2 = map(int, box.xyxy[0])
-
-                            text = f"{label} {conf:.2f}"
-                            cv2.rectangle(display_frame_rgb, (x1, y1), (x2, y2), (255, 0, 0), 2)
-                            cv2.putText(display_frame_rgb, text, (x1, y1 - 5), cv2.FONT_HERSHEY_DUPLEX, 0.7, (255, 0, 0), 2)
-                            
-                            cropped_egg_rgb = analysis_frame[y1:y2, x1:x2]
-
-                            if cropped_egg_rgb.size > 0:
-                                print(f"[INFO] Egg detected: {label} ({conf:.2f})")
-                                
-                                size_label, diagonal_pixels = get_egg_size(cropped_egg_rgb)
-                                print(f"[INFO] Size detected: {size_label} (Diagonal: {diagonal_pixels}px)")
-
-                                serial_command_to_esp32 = f"GRADE_{label}\n"
-                                try:
-                                    ser.write(serial_command_to_esp32.encode('utf-8'))
-                                    print(f"✅ [SERIAL] Sent grade to ESP32: {serial_command_to_esp32.strip()}")
-                                except serial.SerialException as e:
-                                    print(f"❌ [SERIAL ERROR] Failed to send command: {e}")
-
-                                now = datetime.now()
-                                timestamp_str = now.strftime("%Y%m%d_%H%M%S")
-                                
-                                filename = f"{timestamp_str}_{label}_{size_label}.jpg"
-                                filepath = os.path.join(SAVE_DIR, filename)
-                                
-                                cv2.imwrite(filepath, cropped_egg_rgb)
-                                print(f"✅ Cropped egg image saved to {filepath}")
-
-                                result_entry = { 
-                                    "timestamp": now.strftime("%Y-%m-%d %H:%M:%S"),
-                                    "label": label, 
-                                    "confidence": round(conf, 2), 
-                                    "size": size_label,
-                                    "diagonal_pixels": diagonal_pixels,
-                                    "image_path": filepath 
-                                }
-                                save_result_to_json(result_entry)
-
-                                stats = get_stats_from_json()
-                              
-                                last_result = { 
-                                    "label": label, 
-                                    "confidence": conf, 
-                                    "size": size_label,
-                                    "date": now.strftime("%m-%d-%Y"),
-                                    "time": now.strftime("%I:%M:%S %p")
-                                }
-                                captured_img_thumb = cv2.resize(cropped_egg_rgb, (160, 120))
-                            else:
-                                print("[WARN] Detection resulted in an invalid crop.")
-                        else:
-                            print("[WARN] Trigger received, but no egg detected in settled frame.")
-                    
-                    else:
-                        print(f"\n[INFO] Ignoring duplicate trigger (egg bounce).") 
-
-            panel_width = 320
+        self.captured_img_thumb = cv2.resize(cropped_egg_rgb, (160, 120))
+
+    def close(self):
+        if self.ser and self.ser.is_open:
+            self.ser.close()
+            print(f"[{self.name}] Serial port closed.")
+        if self.camera is not None:
+            self.camera.stop()
+
+lanes = [Lane(**lane_config) for lane_config in LANES]
+
+def is_ready():
+    return inference_server.ready.is_set() and all(lane.camera_ready.is_set() for lane in lanes)
+
+def initialize_hardware():
+    """Load the model and warm up every lane's camera in parallel, without blocking the caller."""
+    threads = [threading.Thread(target=inference_server.load, name="model-loader", daemon=True)]
+    for lane in lanes:
+        threads.append(threading.Thread(target=lane.start_camera, name=f"camera-starter-{lane.name}", daemon=True))
+    for t in threads:
+        t.start()
+    return threads
+      
+LABEL_MAP = {
+    "AA - Premium": "AA Premium",
+    "A - Good": "A Good",
+    "B - Fair": "B Fair", # Updated from "B Fail"
+    "Inedible": "Inedible"
+}
+
+def render_panel(lane):
+    last_result = lane.last_result
+    stats = lane.stats
+
+    panel_width = 320
             
-            ui = np.ones((480, panel_width, 3), dtype=np.uint8) * 255 
+    ui = np.ones((480, panel_width, 3), dtype=np.uint8) * 255 
             
-            FONT = cv2.FONT_HERSHEY_DUPLEX
-            TH_TEXT = 1
-            TH_HEADER = 2
+    FONT = cv2.FONT_HERSHEY_DUPLEX
+    TH_TEXT = 1
+    TH_HEADER = 2
             
-            COLOR_BLACK = (0, 0, 0)
-            COLOR_BLUE = (255, 0, 0)
+    COLOR_BLACK = (0, 0, 0)
+    COLOR_BLUE = (255, 0, 0)
             
-            header_text = "LAST EGG CAPTURED"
-            (w, h), _ = cv2.getTextSize(header_text, FONT, 0.7, TH_HEADER)
-            cv2.putText(ui, header_text, ((panel_width - w) // 2, 30), FONT, 0.7, COLOR_BLUE, TH_HEADER)
+    header_text = "LAST EGG CAPTURED" if len(lanes) == 1 else f"{lane.name.upper()} - LAST EGG"
+    (w, h), _ = cv2.getTextSize(header_text, FONT, 0.7, TH_HEADER)
+    cv2.putText(ui, header_text, ((panel_width - w) // 2, 30), FONT, 0.7, COLOR_BLUE, TH_HEADER)
             
-            base_y = 65
-            label_x = 20  # X pos for left-aligned labels
-            value_x = 90  # X pos for left-aligned values
+    base_y = 65
+    label_x = 20  # X pos for left-aligned labels
+    value_x = 90  # X pos for left-aligned values
             
-            cv2.putText(ui, "Grade:", (label_x, base_y), FONT, 0.6, COLOR_BLACK, TH_TEXT)
-            cv2.putText(ui, last_result['label'], (value_x, base_y), FONT, 0.6, COLOR_BLACK, TH_TEXT)
+    cv2.putText(ui, "Grade:", (label_x, base_y), FONT, 0.6, COLOR_BLACK, TH_TEXT)
+    cv2.putText(ui, last_result['label'], (value_x, base_y), FONT, 0.6, COLOR_BLACK, TH_TEXT)
             
-            cv2.putText(ui, "Size:", (label_x, base_y + 30), FONT, 0.6, COLOR_BLACK, TH_TEXT)
-            cv2.putText(ui, last_result['size'], (value_x, base_y + 30), FONT, 0.6, COLOR_BLACK, TH_TEXT)
+    cv2.putText(ui, "Size:", (label_x, base_y + 30), FONT, 0.6, COLOR_BLACK, TH_TEXT)
+    cv2.putText(ui, last_result['size'], (value_x, base_y + 30), FONT, 0.6, COLOR_BLACK, TH_TEXT)
             
-            cv2.putText(ui, "Date:", (label_x, base_y + 60), FONT, 0.6, COLOR_BLACK, TH_TEXT)
-            cv2.putText(ui, last_result['date'], (value_x, base_y + 60), FONT, 0.6, COLOR_BLACK, TH_TEXT)
+    cv2.putText(ui, "Date:", (label_x, base_y + 60), FONT, 0.6, COLOR_BLACK, TH_TEXT)
+    cv2.putText(ui, last_result['date'], (value_x, base_y + 60), FONT, 0.6, COLOR_BLACK, TH_TEXT)
             
-            cv2.putText(ui, "Time:", (label_x, base_y + 90), FONT, 0.6, COLOR_BLACK, TH_TEXT)
-            cv2.putText(ui, last_result['time'], (value_x, base_y + 90), FONT, 0.6, COLOR_BLACK, TH_TEXT)
+    cv2.putText(ui, "Time:", (label_x, base_y + 90), FONT, 0.6, COLOR_BLACK, TH_TEXT)
+    cv2.putText(ui, last_result['time'], (value_x, base_y + 90), FONT, 0.6, COLOR_BLACK, TH_TEXT)
 
-            thumb_h, thumb_w = 120, 160
-            thumb_y_start = 165 # Placed below the text
-            try: 
-                ui[thumb_y_start:thumb_y_start+thumb_h, (panel_width - thumb_w) // 2 : (panel_width - thumb_w) // 2 + thumb_w] = captured_img_thumb
-            except Exception as e: 
-                cv2.rectangle(ui, ((panel_width - thumb_w) // 2, thumb_y_start), ((panel_width + thumb_w) // 2, thumb_y_start + thumb_h), COLOR_BLACK, 1)
+    thumb_h, thumb_w = 120, 160
+    thumb_y_start = 165 # Placed below the text
+    try: 
+        ui[thumb_y_start:thumb_y_start+thumb_h, (panel_width - thumb_w) // 2 : (panel_width - thumb_w) // 2 + thumb_w] = lane.captured_img_thumb
+    except Exception as e: 
+        cv2.rectangle(ui, ((panel_width - thumb_w) // 2, thumb_y_start), ((panel_width + thumb_w) // 2, thumb_y_start + thumb_h), COLOR_BLACK, 1)
 
-            stats_y_start = 320 # Pushed way down
+    stats_y_start = 320 # Pushed way down
             
-            header_text_stats = "STATISTICS"
-            (w, h), _ = cv2.getTextSize(header_text_stats, FONT, 0.6, TH_HEADER)
-            cv2.putText(ui, header_text_stats, ((panel_width - w) // 2, stats_y_start), FONT, 0.6, COLOR_BLUE, TH_HEADER) # Center "STATISTICS"
+    header_text_stats = "STATISTICS"
+    (w, h), _ = cv2.getTextSize(header_text_stats, FONT, 0.6, TH_HEADER)
+    cv2.putText(ui, header_text_stats, ((panel_width - w) // 2, stats_y_start), FONT, 0.6, COLOR_BLUE, TH_HEADER) # Center "STATISTICS"
             
-            col_label_x = 20
-            col_today_x = 200
-            col_all_time_x = 280
-            header_text_today = "Today"
-            header_text_all = "All Time"
-            header_y = stats_y_start + 25 # Move column headers down
+    col_label_x = 20
+    col_today_x = 200
+    col_all_time_x = 280
+    header_text_today = "Today"
+    header_text_all = "All Time"
+    header_y = stats_y_start + 25 # Move column headers down
             
-            (w, h), _ = cv2.getTextSize(header_text_today, FONT, 0.5, TH_TEXT) # Smaller font
-            cv2.putText(ui, header_text_today, (col_today_x - (w//2), header_y), FONT, 0.5, COLOR_BLACK, TH_TEXT) # Center "Today"
+    (w, h), _ = cv2.getTextSize(header_text_today, FONT, 0.5, TH_TEXT) # Smaller font
+    cv2.putText(ui, header_text_today, (col_today_x - (w//2), header_y), FONT, 0.5, COLOR_BLACK, TH_TEXT) # Center "Today"
             
-            (w, h), _ = cv2.getTextSize(header_text_all, FONT, 0.5, TH_TEXT) # Smaller font
-            cv2.putText(ui, header_text_all, (col_all_time_x - (w//2), header_y), FONT, 0.5, COLOR_BLACK, TH_TEXT) # Center "All Time"
+    (w, h), _ = cv2.getTextSize(header_text_all, FONT, 0.5, TH_TEXT) # Smaller font
+    cv2.putText(ui, header_text_all, (col_all_time_x - (w//2), header_y), FONT, 0.5, COLOR_BLACK, TH_TEXT) # Center "All Time"
             
-            stats_today = stats['label_counts_today']
-            stats_all_time = stats['label_counts_all_time']
+    stats_today = stats['label_counts_today']
+    stats_all_time = stats['label_counts_all_time']
             
-            labels_to_display = ["AA - Premium", "A - Good", "B - Fair", "Inedible"]
-            # -------------------------------------------------------
+    labels_to_display = ["AA - Premium", "A - Good", "B - Fair", "Inedible"]
+    # -------------------------------------------------------
             
-            current_y = header_y + 22 # Start rows below the column headers
+    current_y = header_y + 22 # Start rows below the column headers
             
-            for label in labels_to_display:
-                display_name = LABEL_MAP.get(label, label) + ":"
-                today_count = str(stats_today.get(label, 0))
-                all_time_count = str(stats_all_time.get(label, 0))
+    for label in labels_to_display:
+        display_name = LABEL_MAP.get(label, label) + ":"
+        today_count = str(stats_today.get(label, 0))
+        all_time_count = str(stats_all_time.get(label, 0))
                 
-                cv2.putText(ui, display_name, (col_label_x, current_y), FONT, 0.5, COLOR_BLACK, TH_TEXT)
+        cv2.putText(ui, display_name, (col_label_x, current_y), FONT, 0.5, COLOR_BLACK, TH_TEXT)
                 
-                (w, h), _ = cv2.getTextSize(today_count, FONT, 0.5, TH_TEXT)
-                cv2.putText(ui, today_count, (col_today_x - (w//2), current_y), FONT, 0.5, COLOR_BLACK, TH_TEXT)
+        (w, h), _ = cv2.getTextSize(today_count, FONT, 0.5, TH_TEXT)
+        cv2.putText(ui, today_count, (col_today_x - (w//2), current_y), FONT, 0.5, COLOR_BLACK, TH_TEXT)
                 
-                (w, h), _ = cv2.getTextSize(all_time_count, FONT, 0.5, TH_TEXT)
-                cv2.putText(ui, all_time_count, (col_all_time_x - (w//2), current_y), FONT, 0.5, COLOR_BLACK, TH_TEXT)
+        (w, h), _ = cv2.getTextSize(all_time_count, FONT, 0.5, TH_TEXT)
+        cv2.putText(ui, all_time_count, (col_all_time_x - (w//2), current_y), FONT, 0.5, COLOR_BLACK, TH_TEXT)
                 
-                current_y += 22 # Move to next row (smaller gap)
+        current_y += 22 # Move to next row (smaller gap)
             
-            current_y += 3 # Add padding before line
-            cv2.line(ui, (col_label_x, current_y), (col_all_time_x + 30, current_y), COLOR_BLACK, 1) # Separator line
-            current_y += 18 # Add padding after line
+    current_y += 3 # Add padding before line
+    cv2.line(ui, (col_label_x, current_y), (col_all_time_x + 30, current_y), COLOR_BLACK, 1) # Separator line
+    current_y += 18 # Add padding after line
             
-            total_today_str = str(stats['total_today'])
-            total_all_time_str = str(stats['total_all_time'])
+    total_today_str = str(stats['total_today'])
+    total_all_time_str = str(stats['total_all_time'])
             
-            cv2.putText(ui, "Total:", (col_label_x, current_y), FONT, 0.55, COLOR_BLACK, TH_HEADER) # Bold Total
+    cv2.putText(ui, "Total:", (col_label_x, current_y), FONT, 0.55, COLOR_BLACK, TH_HEADER) # Bold Total
             
-            (w, h), _ = cv2.getTextSize(total_today_str, FONT, 0.55, TH_HEADER)
-            cv2.putText(ui, total_today_str, (col_today_x - (w//2), current_y), FONT, 0.55, COLOR_BLACK, TH_HEADER)
+    (w, h), _ = cv2.getTextSize(total_today_str, FONT, 0.55, TH_HEADER)
+    cv2.putText(ui, total_today_str, (col_today_x - (w//2), current_y), FONT, 0.55, COLOR_BLACK, TH_HEADER)
             
-            (w, h), _ = cv2.getTextSize(total_all_time_str, FONT, 0.55, TH_HEADER)
-            cv2.putText(ui, total_all_time_str, (col_all_time_x - (w//2), current_y), FONT, 0.55, COLOR_BLACK, TH_HEADER)
+    (w, h), _ = cv2.getTextSize(total_all_time_str, FONT, 0.55, TH_HEADER)
+    cv2.putText(ui, total_all_time_str, (col_all_time_x - (w//2), current_y), FONT, 0.55, COLOR_BLACK, TH_HEADER)
+
+    return ui
+
+def render_lane(lane):
+    frame = lane.display_frame.copy()
+    if lane.roi is not None: # Drawn before resizing, the ROI is in source-pixel coordinates
+        x1, y1, x2, y2 = lane.roi
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 1)
+    if frame.shape[:2] != (480, 640):
+        frame = cv2.resize(frame, (640, 480))
+    return np.hstack((frame, render_panel(lane)))
+
+def main():
+    lane_threads = []
+    try:
+        print("Starting monitoring UI...")
+
+        for lane in lanes: # Each lane opens its own serial port, so a missing ESP32 only stops that lane
+            t = threading.Thread(target=lane.run, name=f"lane-{lane.name}", daemon=True)
+            t.start()
+            lane_threads.append(t)
 
-            combined_view_rgb = np.hstack((display_frame_rgb, ui))
+        window_name = "Candled Egg Quality Detection"
+        cv2.namedWindow(window_name, cv2.WND_PROP_FULLSCREEN)
+        cv2.setWindowProperty(window_name, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
+
+        print(f"✅ Initial stats: { {lane.name: lane.stats for lane in lanes} }")
+
+        while True:
+            combined_view_rgb = np.vstack([render_lane(lane) for lane in lanes])
             
             cv2.imshow(window_name, combined_view_rgb)
 
@@ -336,16 +693,15 @@ def main():
 
             time.sleep(0.01)
 
-    except serial.SerialException as e:
-        print(f"❌ SERIAL ERROR: Could not open port {SERIAL_PORT}. Details: {e}")
     except KeyboardInterrupt:
         print("\nProgram stopped by user.")
     finally:
         print("Closing resources...")
-        if ser and ser.is_open:
-            ser.close()
-            print("Serial port closed.")
-        picam2.stop()
+        stop_event.set()
+        for t in lane_threads:
+            t.join(timeout=EGG_SETTLE_DELAY_SEC + 1.0)
+        for lane in lanes:
+            lane.close()
         cv2.destroyAllWindows()
         print("Program finished.")
 
@@ -360,25 +716,78 @@ app.add_middleware(
 )
 
 @app.get("/eggs")
-def get_eggs():
-    if not os.path.exists(LOG_PATH):
-        return {"eggs": []}
-    
-    try:
-        with open(LOG_PATH, "r") as f:
-            data = json.load(f)
-    except json.JSONDecodeError:
-        data = [] # Return empty list if file is empty
+def get_eggs(lane: str = None):
+    data = load_results_from_json() # Locked: lane threads rewrite the file concurrently
 
     if isinstance(data, list):
-        return {"eggs": data}   
+        eggs = data
     elif isinstance(data, dict) and "eggs" in data:
-        return data
+        eggs = data["eggs"]
     else:
-        return {"eggs": [data]}
+        eggs = [data]
+
+    if lane is not None:
+        eggs = [egg for egg in eggs if egg.get("lane", DEFAULT_LANE) == lane]
+    return {"eggs": eggs}
+
+@app.get("/lanes")
+def get_lanes():
+    errors = get_startup_errors()
+    return {
+        "lanes": [
+            {
+                "name": lane.name,
+                "camera": lane.camera_source,
+                "serial_port": lane.serial_port,
+                "roi": lane.roi,
+                "size_small_max": lane.size_small_max,
+                "size_medium_max": lane.size_medium_max,
+                "conf": lane.conf,
+                "ready": lane.is_ready() and lane.serial_ready.is_set(),
+                "startup_errors": {k: v for k, v in errors.items() if k.endswith(f"[{lane.name}]")},
+                "runtime_errors": lane.get_errors(),
+                "last_result": lane.last_result,
+                "total_today": lane.stats["total_today"],
+                "total_all_time": lane.stats["total_all_time"],
+            }
+            for lane in lanes
+        ]
+    }
 
 app.mount("/images", StaticFiles(directory=SAVE_DIR), name="images")
 
+@app.get("/health")
+def health():
+    components = {
+        "model": inference_server.ready.is_set(),
+        "lanes": {
+            lane.name: {
+                "camera": lane.camera_ready.is_set(),
+                "serial": lane.serial_ready.is_set(),
+            }
+            for lane in lanes
+        },
+    }
+    errors = get_startup_errors()
+    runtime_errors = {lane.name: lane.get_errors() for lane in lanes}
+    all_ready = components["model"] and all(all(c.values()) for c in components["lanes"].values())
+    if errors:
+        status = "error"
+    elif any(runtime_errors.values()):
+        status = "degraded" # A lane is failing right now; clears once it recovers
+    elif all_ready:
+        status = "ok"
+    else:
+        status = "starting"
+    return {
+        "status": status,
+        "components": components,
+        "errors": errors,
+        "runtime_errors": runtime_errors,
+        "startup_timings": dict(startup_timings),
+        "uptime_sec": round(time.perf_counter() - STARTUP_T0, 3),
+    }
+
 @app.get("/")
 def root():
     return {"message": "Egg API is running! Visit /eggs to view data."}
@@ -392,5 +801,8 @@ if __name__ == '__main__':
     server_thread = threading.Thread(target=run_server, daemon=True)
     server_thread.start()
 
+    print("Loading model and starting cameras in background threads...")
+    initialize_hardware()
+
     print("Starting main CV loop in main thread...")
     main()
@@ -1,14 +1,23 @@
 import serial
 import time
+import csv
 
 serial_port = '/dev/ttyUSB0' 
 baud_rate = 115200 # Must match the Serial.begin() rate in your ESP32 code
+trace_path = None # e.g. 'trigger_trace.csv' to record trigger times for esp32_simulator.py --trace
 
 print(f"Attempting to connect to {serial_port} at {baud_rate} baud...")
 
 try:
     ser = serial.Serial(serial_port, baud_rate, timeout=1)
     print("Connection successful! Listening for triggers...")
+
+    trace_file = open(trace_path, "w", newline="") if trace_path else None
+    if trace_file:
+        trace_writer = csv.writer(trace_file)
+        trace_writer.writerow(["t"])
+        first_trigger_time = None
+        print(f"Recording trigger trace to {trace_path}")
     
     while True:
         if ser.in_waiting > 0:
@@ -18,6 +27,13 @@ try:
             
             if message == "OBJECT_DETECTED":
                 print("✨ TRIGGER RECEIVED! An object was detected by the ESP32.")
+
+                if trace_file:
+                    now = time.time()
+                    if first_trigger_time is None:
+                        first_trigger_time = now
+                    trace_writer.writerow([round(now - first_trigger_time, 3)])
+                    trace_file.flush()
                 
             elif message == "OBJECT_GONE":
                 print("Object is no longer detected.")
@@ -32,6 +48,8 @@ except KeyboardInterrupt:
     print("\nProgram stopped by user.")
 
 finally:
+    if 'trace_file' in locals() and trace_file:
+        trace_file.close()
     if 'ser' in locals() and ser.is_open:
         ser.close()
         print("Serial port closed.")